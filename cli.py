@@ -2,12 +2,44 @@
 Baikon CLI - Simple but working version
 """
 
+import io
 import os
+import re
 import sys
 import asyncio
+import functools
 import time
 from typing import Optional
-from engine import BaikonEngine, FlowContext
+from engine import BaikonEngine, FlowContext, run
+from parser import parse_set_literal
+
+_BOT_PREFIX = "🤖 "
+_USER_PREFIX = "You → "
+
+# set <var>=<value>
+_SET_RE = re.compile(r'^\s*set\s+([A-Za-z_]\w*)\s*=\s*(.*?)\s*$', re.IGNORECASE)
+
+# call <function> or call <function>()
+_CALL_RE = re.compile(r'^\s*call\s+(\w+)(?:\(\s*\))?\s*$', re.IGNORECASE)
+
+_HELP_TEXT = """
+🔧 Baikon CLI Commands:
+   
+📝 Basic Commands:
+   help           - Show this help message
+   quit/exit      - Exit the CLI
+   
+🔄 Flow Management:
+   flows          - List available flows
+   functions      - List available functions
+   
+💾 Session & Data:
+   variables/vars - Show current variables
+   set <var>=<val>- Set a variable value
+   
+🚀 Advanced:
+   call <function> - Call a function directly
+        """
 
 
 class BaikonCLI:
@@ -15,6 +47,24 @@ class BaikonCLI:
         self.engine = BaikonEngine()
         self.running = False
         self.current_context = None
+        self._input_buffer = b''
+        self._module_info_cache = None
+        
+        # Command dispatch tables
+        self._exact_commands = {
+            'quit': self._quit,
+            'exit': self._quit,
+            'q': self._quit,
+            'help': self._show_help,
+            'variables': self._show_variables,
+            'vars': self._show_variables,
+            'flows': self._show_flows,
+            'functions': self._show_functions,
+        }
+        self._prefix_commands = (
+            ('call ', self._handle_call_command),
+            ('set ', self._handle_set_command),
+        )
     
     async def start(self, flow_file: str = "main.flow", debug: bool = False):
         """Start the CLI"""
@@ -22,21 +72,24 @@ class BaikonCLI:
         print("=" * 60)
         
         # Load the flow file
-        if not os.path.exists(flow_file):
+        try:
+            loaded = self.engine.load_module(flow_file, "main")
+        except FileNotFoundError:
             print(f"❌ Flow file '{flow_file}' not found!")
             return
         
-        if not self.engine.load_module(flow_file, "main"):
+        if not loaded:
             print(f"❌ Failed to load flow file '{flow_file}'")
             return
         
+        self._module_info_cache = None
         print(f"✅ Loaded module: {flow_file}")
         
         # Create context
         self.current_context = await self.engine.create_context("cli_user", f"session_{int(time.time())}")
         
         # Show module info
-        await self._show_module_info()
+        self._show_module_info()
         
         print("\n💬 Start chatting! Type 'help' for commands or 'quit' to exit.")
         print("-" * 60)
@@ -44,9 +97,15 @@ class BaikonCLI:
         self.running = True
         await self._main_loop()
     
-    async def _show_module_info(self):
+    def _module_info(self) -> Optional[dict]:
+        """Get info for the main module, cached until it is reloaded"""
+        if self._module_info_cache is None:
+            self._module_info_cache = self.engine.get_module_info("main")
+        return self._module_info_cache
+    
+    def _show_module_info(self):
         """Display module information"""
-        info = self.engine.get_module_info("main")
+        info = self._module_info()
         if info:
             print(f"📋 Module Overview:")
             print(f"   • Flows: {len(info['flows'])} ({', '.join(info['flows'])})")
@@ -57,25 +116,24 @@ class BaikonCLI:
         """Main interaction loop"""
         while self.running:
             try:
-                user_input = input("You → ").strip()
+                user_input = (await self._get_user_input()).strip()
                 
                 if not user_input:
                     continue
                 
                 # Handle commands
-                if await self._handle_command(user_input):
+                if self._handle_command(user_input):
                     continue
                 
                 # Process through engine
                 responses = await self.engine.process_input(user_input, self.current_context)
                 
                 if responses:
-                    for response in responses:
-                        print(f"🤖 {response}")
+                    self._print_responses(responses)
                 else:
                     print("🤔 I don't understand that. Try 'help' for available commands.")
                 
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, asyncio.CancelledError):
                 print("\n👋 Goodbye!")
                 break
             except EOFError:
@@ -84,101 +142,116 @@ class BaikonCLI:
             except Exception as e:
                 print(f"❌ Error: {e}")
     
-    async def _handle_command(self, user_input: str) -> bool:
-        """Handle special commands"""
-        command = user_input.lower()
+    def _print_responses(self, responses):
+        """Print bot responses in a single write"""
+        sys.stdout.write("".join(_BOT_PREFIX + response + "\n" for response in responses))
+    
+    async def _get_user_input(self, prompt: str = _USER_PREFIX) -> str:
+        """Read a line of input without blocking the event loop"""
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
         
-        if command in ['quit', 'exit', 'q']:
-            print("👋 Thanks for using Baikon!")
-            self.running = False
-            return True
+        while b'\n' not in self._input_buffer:
+            chunk = await self._read_stdin()
+            if chunk is None:
+                # stdin can't be polled here, fall back to a blocking read
+                return input()
+            if not chunk:
+                if not self._input_buffer:
+                    raise EOFError
+                break
+            self._input_buffer += chunk
         
-        elif command == 'help':
-            self._show_help()
-            return True
+        line, _, self._input_buffer = self._input_buffer.partition(b'\n')
+        return line.decode(sys.stdin.encoding or 'utf-8', errors='replace')
+    
+    async def _read_stdin(self) -> Optional[bytes]:
+        """Wait until stdin is readable and read it, or return None if it can't be polled"""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
         
-        elif command == 'variables' or command == 'vars':
-            self._show_variables()
-            return True
+        try:
+            # Streams without a real descriptor (StringIO, IDLE) fall back to input()
+            fd = sys.stdin.fileno()
+            loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        except (NotImplementedError, OSError, ValueError, AttributeError, io.UnsupportedOperation):
+            return None
         
-        elif command == 'flows':
-            self._show_flows()
-            return True
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
         
-        elif command == 'functions':
-            self._show_functions()
-            return True
+        return os.read(fd, 4096)
+    
+    def _handle_command(self, user_input: str) -> bool:
+        """Handle special commands"""
+        command = user_input.lower()
         
-        elif command.startswith('call '):
-            await self._handle_call_command(command)
+        handler = self._exact_commands.get(command)
+        if handler is not None:
+            handler()
             return True
         
-        elif command.startswith('set '):
-            self._handle_set_command(command)
-            return True
+        for prefix, prefix_handler in self._prefix_commands:
+            if command.startswith(prefix):
+                prefix_handler(command)
+                return True
         
         return False
     
+    def _quit(self):
+        """Stop the CLI"""
+        print("👋 Thanks for using Baikon!")
+        self.running = False
+    
     def _show_help(self):
         """Show help"""
-        print("""
-🔧 Baikon CLI Commands:
-   
-📝 Basic Commands:
-   help           - Show this help message
-   quit/exit      - Exit the CLI
-   
-🔄 Flow Management:
-   flows          - List available flows
-   functions      - List available functions
-   
-💾 Session & Data:
-   variables/vars - Show current variables
-   set <var>=<val>- Set a variable value
-   
-🚀 Advanced:
-   call <function> - Call a function directly
-        """)
+        sys.stdout.write(_HELP_TEXT + "\n")
     
     def _show_variables(self):
         """Show variables"""
         if self.current_context and self.current_context.variables:
-            print("📊 Current Variables:")
-            for name, value in self.current_context.variables.items():
-                print(f"   {name} = {value}")
+            lines = ["📊 Current Variables:"]
+            lines.extend(f"   {name} = {value}" for name, value in self.current_context.variables.items())
+            sys.stdout.write("\n".join(lines) + "\n")
         else:
             print("📊 No variables set")
     
     def _show_flows(self):
         """Show flows"""
-        info = self.engine.get_module_info("main")
+        info = self._module_info()
         if info:
-            print("🔄 Available Flows:")
-            for flow_name in info['flows']:
-                print(f"   • {flow_name}")
+            lines = ["🔄 Available Flows:"]
+            lines.extend(f"   • {flow_name}" for flow_name in info['flows'])
+            sys.stdout.write("\n".join(lines) + "\n")
     
     def _show_functions(self):
         """Show functions"""
-        info = self.engine.get_module_info("main")
+        info = self._module_info()
         if info:
-            print("⚙️ Available Functions:")
-            for func_name in info['functions']:
-                print(f"   • {func_name}")
+            lines = ["⚙️ Available Functions:"]
+            lines.extend(f"   • {func_name}" for func_name in info['functions'])
+            sys.stdout.write("\n".join(lines) + "\n")
     
-    async def _handle_call_command(self, command: str):
+    def _handle_call_command(self, command: str):
         """Handle function calls"""
+        match = _CALL_RE.match(command)
+        if not match:
+            print("❌ Usage: call <function>")
+            return
+        
         try:
-            func_name = command[5:].strip()
+            func_name = match.group(1)
             
             # Get the module
             module = self.engine.modules.get("main")
             if module and func_name in module.functions:
                 function = module.functions[func_name]
-                result = await self.engine._call_function(function, module, self.current_context)
+                result = self.engine._call_function(function, module, self.current_context)
                 
                 if result:
-                    for response in result:
-                        print(f"🤖 {response}")
+                    self._print_responses(result)
                 else:
                     print(f"✅ Function {func_name} executed")
             else:
@@ -188,34 +261,27 @@ class BaikonCLI:
     
     def _handle_set_command(self, command: str):
         """Handle variable setting"""
-        try:
-            parts = command[4:].split('=', 1)
-            if len(parts) == 2:
-                var_name = parts[0].strip()
-                value = parts[1].strip().strip('"')
-                
-                # Try to convert to number
-                try:
-                    if '.' in value:
-                        value = float(value)
-                    else:
-                        value = int(value)
-                except ValueError:
-                    pass
-                
-                if self.current_context:
-                    self.current_context.variables[var_name] = value
-                    print(f"✅ Set {var_name} = {value}")
-                else:
-                    print("❌ No active context")
-            else:
-                print("❌ Usage: set <variable>=<value>")
-        except Exception as e:
-            print(f"❌ Error setting variable: {e}")
+        match = _SET_RE.match(command)
+        if not match:
+            print("❌ Usage: set <variable>=<value>")
+            return
+        
+        var_name = match.group(1)
+        value = match.group(2).strip('"')
+        
+        # Integers are converted the same way as SET values in flow files
+        value = parse_set_literal(value)
+        
+        if self.current_context:
+            self.current_context.variables[var_name] = value
+            print(f"✅ Set {var_name} = {value}")
+        else:
+            print("❌ No active context")
 
 
-async def main():
-    """Main entry point"""
+@functools.lru_cache(maxsize=None)
+def _build_arg_parser():
+    """Build the command line parser once"""
     import argparse
     
     parser = argparse.ArgumentParser(description="Baikon CLI v2.0 - Enhanced AI Agent Framework")
@@ -223,12 +289,16 @@ async def main():
                        help="Flow file to load (default: main.flow)")
     parser.add_argument("--debug", action="store_true", 
                        help="Enable debug mode")
-    
-    args = parser.parse_args()
+    return parser
+
+
+async def main():
+    """Main entry point"""
+    args = _build_arg_parser().parse_args()
     
     cli = BaikonCLI()
     await cli.start(args.file, args.debug)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run(main())
\ No newline at end of file
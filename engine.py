@@ -3,17 +3,75 @@ Baikon Engine - Simple but working version
 """
 
 import asyncio
+import re
 import time
 import logging
-from typing import Dict, List, Any, Optional
-from parser import BaikonParser, FlowModule, Flow, FlowFunction, FlowAction, FlowTrigger, ActionType, TriggerType
+from itertools import islice
+from typing import Dict, Iterable, List, Any, Optional
+from parser import (
+    BaikonParser, FlowModule, Flow, FlowFunction, FlowAction, ActionType, TriggerType,
+    SET_CONST, SET_TEXT, SET_ADD, compile_set_value, is_regex_pattern, split_template
+)
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Maximum number of compiled trigger regexes kept by an engine
+REGEX_CACHE_SIZE = 500
+
+# How a USER_SAYS pattern is matched against normalized input
+MATCH_EXACT = "exact"
+MATCH_PREFIX = "prefix"
+MATCH_SUFFIX = "suffix"
+MATCH_CONTAINS = "contains"
+MATCH_REGEX = "regex"
+
+# Variable types whose rendered text is cached per context
+_STR_CACHED_TYPES = (int, float, bool)
+
+
+def _is_number(value: Any) -> bool:
+    """Check if a value can take part in SET arithmetic"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
 
 
 class FlowContext:
     """Execution context for flows"""
+    __slots__ = ('variables', 'start_time', '_str_cache')
+    
     def __init__(self):
         self.variables = {}
         self.start_time = time.time()
+        # Variable name -> (value, str(value)) for the last rendered value
+        self._str_cache = {}
+    
+    def render_value(self, name: str, value: Any) -> str:
+        """Render a variable's value as text, reusing the last conversion if unchanged"""
+        if type(value) is str:
+            return value
+        cached = self._str_cache.get(name)
+        if cached is not None and cached[0] is value:
+            return cached[1]
+        text = str(value)
+        if type(value) in _STR_CACHED_TYPES:
+            self._str_cache[name] = (value, text)
+        return text
+
+
+class TriggerIndex:
+    """Triggers of all loaded modules bucketed by match strategy"""
+    def __init__(self):
+        # Entries are (rank, module, flow, function); rank orders by module load order,
+        # then priority, then declaration
+        self.exact: Dict[str, List[tuple]] = {}
+        # (match kind, lowercased needle, entry) triples
+        self.wildcard: List[tuple] = []
+        # All wildcard needles as one alternation; group i+1 is wildcard[i]
+        self.wildcard_re: Optional[re.Pattern] = None
+        # (compiled regex, entry) pairs
+        self.regex: List[tuple] = []
 
 
 class BaikonEngine:
@@ -21,40 +79,105 @@ class BaikonEngine:
         self.parser = BaikonParser()
         self.modules = {}
         self.config = config or {}
+        self._regex_cache: Dict[str, re.Pattern] = {}
+        self._trigger_index = TriggerIndex()
+        self._default_vars: Dict[str, Any] = {}
         
-        # Set up logging
-        logging.basicConfig(
-            level=getattr(logging, self.config.get('log_level', 'INFO').upper()),
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
+        # Set up logging, once per process
+        if not logging.root.handlers:
+            logging.basicConfig(
+                level=getattr(logging, self.config.get('log_level', 'INFO').upper()),
+                format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+            )
         self.logger = logging.getLogger('BaikonEngine')
     
     def load_module(self, filepath: str, module_name: str = None) -> bool:
-        """Load a flow module"""
+        """Load a flow module, raising FileNotFoundError if the file is missing"""
         try:
             module = self.parser.parse_file(filepath)
             
             if module_name:
                 module.name = module_name
             
-            self.modules[module.name] = module
+            self.add_module(module)
             
-            self.logger.info(f"Loaded module: {module.name}")
+            self.logger.info("Loaded module: %s", module.name)
             return True
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error loading module {filepath}: {e}")
+            self.logger.error("Error loading module %s: %s", filepath, e)
             return False
     
+    def add_module(self, module: FlowModule):
+        """Register an already parsed module"""
+        for problem in self.parser.validate_module(module):
+            self.logger.warning("Module %s: %s", module.name, problem)
+        
+        # Build everything first so a module that fails to index is never registered
+        modules = {**self.modules, module.name: module}
+        trigger_index = self._build_trigger_index(modules.values())
+        
+        # Merge variable defaults once; later modules win on name clashes
+        default_vars = {}
+        for loaded in modules.values():
+            for var_name, var_def in loaded.variables.items():
+                default_vars[var_name] = var_def.value
+        
+        self.modules = modules
+        self._trigger_index = trigger_index
+        self._default_vars = default_vars
+    
+    def _build_trigger_index(self, modules: Iterable[FlowModule]) -> TriggerIndex:
+        """Classify the triggers of all modules into exact, wildcard and regex buckets"""
+        index = TriggerIndex()
+        
+        # Module by module; higher priority first, declaration order within a priority
+        triggers = []
+        for module in modules:
+            module_triggers = [(module, flow, trigger) for flow in module.flows.values()
+                               for trigger in flow.triggers if trigger.type == TriggerType.USER_SAYS]
+            module_triggers.sort(key=lambda triple: -triple[2].priority)
+            triggers.extend(module_triggers)
+        
+        for rank, (module, flow, trigger) in enumerate(triggers):
+            # Resolve the function now so a match dispatches straight to it
+            function = module.functions.get(trigger.function)
+            if function is None:
+                continue
+            
+            entry = (rank, module, flow, function)
+            kind, needle = self._classify_pattern(trigger.pattern)
+            
+            if kind == MATCH_EXACT:
+                index.exact.setdefault(needle, []).append(entry)
+            elif kind == MATCH_REGEX:
+                index.regex.append((needle, entry))
+            else:
+                index.wildcard.append((kind, needle, entry))
+        
+        if index.wildcard:
+            index.wildcard_re = re.compile(
+                '|'.join(f'({self._wildcard_fragment(kind, needle)})' for kind, needle, _ in index.wildcard),
+                re.DOTALL
+            )
+        
+        return index
+    
+    @staticmethod
+    def _wildcard_fragment(kind: str, needle: str) -> str:
+        """Translate a wildcard needle into a regex anchored at the start of the input"""
+        if kind == MATCH_CONTAINS:
+            return '.*?' + re.escape(needle)
+        elif kind == MATCH_SUFFIX:
+            return '.*' + re.escape(needle) + r'\Z'
+        return re.escape(needle)
+    
     async def create_context(self, user_id: str = None, session_id: str = None) -> FlowContext:
         """Create execution context"""
         context = FlowContext()
-        
-        # Load variables from modules
-        for module in self.modules.values():
-            for var_name, var_def in module.variables.items():
-                context.variables[var_name] = var_def.value
-        
+        context.variables = self._default_vars.copy()
         return context
     
     async def process_input(self, user_input: str, context: FlowContext = None) -> List[str]:
@@ -65,98 +188,155 @@ class BaikonEngine:
         responses = []
         user_input = user_input.strip().lower()
         
-        # Find matching flows
-        for module in self.modules.values():
-            for flow_name, flow in module.flows.items():
-                for trigger in flow.triggers:
-                    if self._match_trigger(user_input, trigger):
-                        # Get the function to call
-                        func_name = self.parser.get_function_for_trigger(flow_name, trigger.pattern)
-                        if func_name and func_name in module.functions:
-                            self.logger.info(f"Executing flow: {flow_name}")
-                            result = await self._call_function(module.functions[func_name], module, context)
-                            if result:
-                                responses.extend(result)
-                            self.logger.info(f"Flow {flow_name} completed")
+        # Find matching flows across all modules
+        for module, flow, function in self._find_matches(user_input):
+            self.logger.info("Executing flow: %s", flow.name)
+            result = self._call_function(function, module, context)
+            if result:
+                responses.extend(result)
+            self.logger.info("Flow %s completed", flow.name)
         
         return responses
     
-    def _match_trigger(self, user_input: str, trigger: FlowTrigger) -> bool:
-        """Check if user input matches a trigger"""
-        if trigger.type == TriggerType.USER_SAYS:
-            pattern = trigger.pattern.lower().strip()
-            user_input_lower = user_input.lower().strip()
-            
-            # Exact match
-            if user_input_lower == pattern:
-                return True
-            
-            # Wildcard matching
-            if '*' in pattern:
-                # Simple wildcard support
-                if pattern.startswith('*') and pattern.endswith('*'):
-                    search_term = pattern[1:-1]
-                    return search_term in user_input_lower
-                elif pattern.startswith('*'):
-                    return user_input_lower.endswith(pattern[1:])
-                elif pattern.endswith('*'):
-                    return user_input_lower.startswith(pattern[:-1])
-            
-            return False
+    def _find_matches(self, user_input: str) -> List[tuple]:
+        """Find the (module, flow, function) of every trigger matching normalized input, in rank order"""
+        index = self._trigger_index
+        matches = list(index.exact.get(user_input, ()))
+        
+        # Alternation picks the first matching wildcard, so one scan settles the common miss
+        first = index.wildcard_re.match(user_input) if index.wildcard_re else None
+        if first is not None:
+            position = first.lastindex - 1
+            matches.append(index.wildcard[position][2])
+            for kind, needle, entry in islice(index.wildcard, position + 1, None):
+                if self._match_pattern(user_input, kind, needle):
+                    matches.append(entry)
+        
+        for compiled, entry in index.regex:
+            if compiled.search(user_input):
+                matches.append(entry)
+        
+        if len(matches) > 1:
+            matches.sort(key=lambda entry: entry[0])
+        return [entry[1:] for entry in matches]
+    
+    def _classify_pattern(self, pattern: str) -> tuple:
+        """Work out how a USER_SAYS pattern matches, returning (kind, needle)"""
+        # Regex matching: "/pattern/", compiled up front so matching never compiles
+        if is_regex_pattern(pattern):
+            return MATCH_REGEX, self._get_regex(pattern)
+        
+        # Simple wildcard support; the parser already stripped and lowercased the pattern
+        if pattern.startswith('*') and pattern.endswith('*'):
+            return MATCH_CONTAINS, pattern[1:-1]
+        elif pattern.startswith('*'):
+            return MATCH_SUFFIX, pattern[1:]
+        elif pattern.endswith('*'):
+            return MATCH_PREFIX, pattern[:-1]
         
-        return False
+        return MATCH_EXACT, pattern
     
-    async def _call_function(self, function: FlowFunction, module: FlowModule, context: FlowContext) -> List[str]:
+    @staticmethod
+    def _match_pattern(user_input: str, kind: str, needle: Any) -> bool:
+        """Check if normalized user input matches a classified pattern"""
+        if kind == MATCH_CONTAINS:
+            return needle in user_input
+        elif kind == MATCH_PREFIX:
+            return user_input.startswith(needle)
+        elif kind == MATCH_SUFFIX:
+            return user_input.endswith(needle)
+        elif kind == MATCH_REGEX:
+            return bool(needle.search(user_input))
+        return user_input == needle
+    
+    def _get_regex(self, pattern: str) -> re.Pattern:
+        """Get the compiled regex for a /regex/ trigger pattern"""
+        compiled = self._regex_cache.get(pattern)
+        if compiled is None:
+            # Evict the oldest entry once the cache is full
+            if len(self._regex_cache) >= REGEX_CACHE_SIZE:
+                del self._regex_cache[next(iter(self._regex_cache))]
+            compiled = self._regex_cache[pattern] = re.compile(pattern[1:-1], re.IGNORECASE)
+        return compiled
+    
+    def _call_function(self, function: FlowFunction, module: FlowModule, context: FlowContext) -> List[str]:
         """Call a function"""
         responses = []
         
         for action in function.actions:
-            result = await self._execute_action(action, context)
+            result = self._execute_action(action, context)
             if result:
                 responses.append(result)
         
         return responses
     
-    async def _execute_action(self, action: FlowAction, context: FlowContext) -> Optional[str]:
+    def _execute_action(self, action: FlowAction, context: FlowContext) -> Optional[str]:
         """Execute a single action"""
         if action.type == ActionType.SAY:
-            message = action.params['message']
-            # Substitute variables
-            message = self._substitute_variables(message, context)
-            return message
+            # Substitute variables, using the template split at parse time
+            segments = action.params.get('_segments')
+            if segments is None:
+                return self._substitute_variables(action.params['message'], context)
+            return self._render_segments(segments, context)
         
         elif action.type == ActionType.SET:
             var_name = action.params['variable']
             value = action.params['value']
             
-            # Handle arithmetic
-            if isinstance(value, str) and '+' in value:
-                try:
-                    parts = value.split('+')
-                    if len(parts) == 2:
-                        left = parts[0].strip()
-                        right = parts[1].strip()
-                        
-                        # If left side is a variable
-                        if left in context.variables:
-                            left_val = context.variables[left]
-                            if isinstance(left_val, int) and right.isdigit():
-                                value = left_val + int(right)
-                except:
-                    pass
+            # Handle arithmetic, classified at parse time
+            if isinstance(value, str):
+                op = action.params.get('_op') or compile_set_value(value)
+                value = self._evaluate_set(op, value, context)
             
             context.variables[var_name] = value
             return None
         
         return None
     
+    def _evaluate_set(self, op: tuple, value: str, context: FlowContext) -> Any:
+        """Compute a classified SET value; arithmetic over non-numbers keeps the text"""
+        kind = op[0]
+        if kind == SET_TEXT or kind == SET_CONST:
+            return op[1]
+        
+        variables = context.variables
+        if kind == SET_ADD:
+            left = variables.get(op[1]) if isinstance(op[1], str) else op[1]
+            right = variables.get(op[2]) if isinstance(op[2], str) else op[2]
+            if _is_number(left) and _is_number(right):
+                return left + right
+            return value
+        
+        code, names = op[1], op[2]
+        if not all(_is_number(variables.get(name)) for name in names):
+            return value
+        
+        try:
+            return eval(code, {'__builtins__': {}}, variables)
+        except ArithmeticError:
+            return value
+    
     def _substitute_variables(self, text: str, context: FlowContext) -> str:
         """Substitute variables in text using {variable_name} syntax"""
-        for var_name, value in context.variables.items():
-            placeholder = f'{{{var_name}}}'
-            if placeholder in text:
-                text = text.replace(placeholder, str(value))
-        return text
+        if '{' not in text:
+            return text
+        return self._render_segments(split_template(text), context)
+    
+    def _render_segments(self, segments: List[str], context: FlowContext) -> str:
+        """Join a split template, filling in variables; unknown names are kept as {name}"""
+        if len(segments) == 1:
+            return segments[0]
+        
+        variables = context.variables
+        parts = [segments[0]]
+        for i in range(1, len(segments), 2):
+            var_name = segments[i]
+            if var_name in variables:
+                parts.append(context.render_value(var_name, variables[var_name]))
+            else:
+                parts.append('{' + var_name + '}')
+            parts.append(segments[i + 1])
+        return ''.join(parts)
     
     def get_module_info(self, module_name: str) -> Optional[Dict[str, Any]]:
         """Get information about a loaded module"""
@@ -177,6 +357,13 @@ class BaikonEngine:
         return list(self.modules.keys())
 
 
+def run(main_coro, use_uvloop: bool = True):
+    """Run an async entry point, on uvloop when it is installed"""
+    if use_uvloop and uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main_coro)
+
+
 async def main():
     """Test the engine"""
     engine = BaikonEngine({'log_level': 'INFO'})
@@ -197,7 +384,7 @@ function show_help:
     
     # Parse and load
     module = engine.parser.parse_content(test_content, "test")
-    engine.modules["test"] = module
+    engine.add_module(module)
     
     # Test
     context = await engine.create_context()
@@ -212,4 +399,4 @@ function show_help:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run(main())
\ No newline at end of file
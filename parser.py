@@ -2,12 +2,124 @@
 Baikon Parser - Simple but working version
 """
 
+import ast
+import functools
+import logging
 import re
-from typing import Dict, List, Any, Optional
+import sys
+from typing import Dict, Iterable, List, Any, Optional
 from dataclasses import dataclass
 from enum import Enum
 
 
+# Flow trigger lines
+_TRIGGER_RE = re.compile(r'when user says "(?P<pattern>[^"]+)"\s*->\s*call\s+(?P<function>\w+)')
+
+# All function actions in one pattern; lastgroup names the action that matched
+_ACTION_RE = re.compile(
+    r'(?P<say>say "(?P<message>[^"]+)")'
+    r'|(?P<set>set (?P<variable>\w+)\s*=\s*(?P<value>.+))'
+)
+
+# Leading keywords of header lines that are skipped for now
+_SKIPPED_KEYWORDS = frozenset(('version:', 'config:', 'var', 'import'))
+
+# Leading keywords that open a block, mapped to the block type
+_BLOCK_KEYWORDS = {'flow': 'flow', 'function': 'function'}
+
+# {variable_name} placeholders in messages
+_VAR_RE = re.compile(r'\{(\w+)\}')
+
+
+# How a SET value is computed, stored as params['_op']:
+#   (SET_CONST, integer), (SET_TEXT, text),
+#   (SET_ADD, left, right) where operands are numbers or variable names,
+#   (SET_EXPR, code, variable names)
+SET_CONST = "const"
+SET_TEXT = "text"
+SET_ADD = "add"
+SET_EXPR = "expr"
+
+_NUMBER_RE = re.compile(r'^-?\d+(?:\.\d+)?$')
+
+# The common SET arithmetic shape: name or number + name or number
+_SIMPLE_ADD_RE = re.compile(r'^\s*([A-Za-z_]\w*|\d+(?:\.\d+)?)\s*\+\s*([A-Za-z_]\w*|\d+(?:\.\d+)?)\s*$')
+
+# AST nodes allowed in SET arithmetic
+_EXPR_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.UAdd, ast.USub
+)
+
+
+def split_template(text: str) -> List[str]:
+    """Split a message into alternating literal text and {variable} names"""
+    segments = _VAR_RE.split(text)
+    # Variable names are dict keys at render time
+    segments[1::2] = [sys.intern(name) for name in segments[1::2]]
+    return segments
+
+
+def is_regex_pattern(pattern: str) -> bool:
+    """Check if a trigger pattern is written as /regex/"""
+    return len(pattern) > 2 and pattern.startswith('/') and pattern.endswith('/')
+
+
+def _indent_width(line: str) -> int:
+    """Width of a line's leading whitespace, with tab stops every 4 columns"""
+    prefix = line[:len(line) - len(line.lstrip())]
+    return len(prefix.expandtabs(4)) if '\t' in prefix else len(prefix)
+
+
+def _parse_number(token: str) -> Any:
+    """Convert a numeric literal to int or float"""
+    return float(token) if '.' in token else int(token)
+
+
+def parse_set_literal(value: str) -> Any:
+    """Convert a SET literal to an int if it is a canonical integer; anything else stays text"""
+    # '19.90' or '02134' keep their text as written
+    if _NUMBER_RE.match(value) and '.' not in value and str(int(value)) == value:
+        return int(value)
+    return value
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_set_value(value: str) -> tuple:
+    """Classify a SET value once: a number, an addition, arithmetic or plain text"""
+    if _NUMBER_RE.match(value):
+        literal = parse_set_literal(value)
+        return (SET_TEXT, value) if isinstance(literal, str) else (SET_CONST, literal)
+    
+    match = _SIMPLE_ADD_RE.match(value)
+    # At least one operand must be a variable; '1 + 2' is kept as text
+    if match and not (match.group(1)[0].isdigit() and match.group(2)[0].isdigit()):
+        left, right = match.groups()
+        return (SET_ADD,
+                _parse_number(left) if left[0].isdigit() else left,
+                _parse_number(right) if right[0].isdigit() else right)
+    
+    try:
+        tree = ast.parse(value, mode='eval')
+    except SyntaxError:
+        return SET_TEXT, value
+    
+    nodes = list(ast.walk(tree))
+    if (isinstance(tree.body, ast.BinOp)
+            and all(isinstance(node, _EXPR_NODES) for node in nodes)
+            and all(type(node.value) in (int, float) for node in nodes if isinstance(node, ast.Constant))):
+        names = frozenset(node.id for node in nodes if isinstance(node, ast.Name))
+        # Constant-only values such as dates or phone numbers ('2024-10-15') stay text
+        if names:
+            return SET_EXPR, compile(tree, '<set>', 'eval'), names
+    
+    return SET_TEXT, value
+
+
+# Parsed nodes use __slots__ where dataclasses support it (Python 3.10+)
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
 class ActionType(Enum):
     SAY = "say"
     SET = "set"
@@ -18,40 +130,41 @@ class TriggerType(Enum):
     USER_SAYS = "user_says"
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class FlowVariable:
     name: str
     value: Any = None
     type: str = "string"
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class FlowAction:
     type: ActionType
     params: Dict[str, Any]
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class FlowTrigger:
     type: TriggerType
     pattern: str
     priority: int = 0
+    function: Optional[str] = None
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class FlowFunction:
     name: str
     actions: List[FlowAction]
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class Flow:
     name: str
     triggers: List[FlowTrigger]
     middleware: List[str] = None
 
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class FlowModule:
     name: str
     flows: Dict[str, Flow]
@@ -66,13 +179,16 @@ class BaikonParser:
         self.flows = {}
         self.functions = {}
         self.variables = {}
+        # Trigger->function mapping of the last parse
+        self._trigger_actions = {}
+        self.logger = logging.getLogger('BaikonParser')
     
     def parse_file(self, filepath: str) -> FlowModule:
         """Parse a .flow file and return structured data"""
         try:
+            # Lines are read as they are parsed rather than loading the whole file
             with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return self.parse_content(content, filepath)
+                return self._parse_lines(f, filepath)
         except FileNotFoundError:
             raise FileNotFoundError(f"Flow file not found: {filepath}")
         except Exception as e:
@@ -80,50 +196,59 @@ class BaikonParser:
     
     def parse_content(self, content: str, filename: str = "inline") -> FlowModule:
         """Parse flow content string into structured data"""
-        self.flows = {}
-        self.functions = {}
-        self.variables = {}
-        
-        # Clean up content
-        lines = [line.strip() for line in content.split('\n') if line.strip() and not line.strip().startswith('#')]
+        return self._parse_lines(content.splitlines(), filename)
+    
+    def _parse_lines(self, raw_lines: Iterable[str], filename: str) -> FlowModule:
+        """Parse flow source lines into structured data"""
+        self._trigger_actions = {}
         
-        current_block = None
-        current_name = None
-        current_content = []
+        # (block type, name, lines) of every flow and function, in file order
+        blocks = []
+        current_content = None
+        current_type = current_name = None
+        block_indent = 0
         
-        for line in lines:
+        for line_number, raw_line in enumerate(raw_lines, 1):
+            # Skip blank lines and comments
+            line = raw_line.strip()
+            if not line or line[0] == '#':
+                continue
+            
+            # Dispatch on the leading keyword
+            keyword = line.split(None, 1)[0]
+            
+            # A line indented no deeper than the block header ends the block
+            indent = _indent_width(raw_line)
+            if current_content is not None and indent <= block_indent:
+                # A header followed straight away by an unindented line lost its body
+                if not current_content and keyword not in _SKIPPED_KEYWORDS and keyword not in _BLOCK_KEYWORDS:
+                    self.logger.warning("%s:%d: %s '%s' has no indented body; ignoring lines from: %s",
+                                        filename, line_number, current_type, current_name, line)
+                current_content = None
+            
             # Skip version and config lines for now
-            if line.startswith(('version:', 'config:', 'var ', 'import ')):
+            if keyword in _SKIPPED_KEYWORDS:
                 continue
-                
-            if line.startswith('flow '):
-                # Save previous block
-                if current_block and current_name:
-                    self._process_block(current_block, current_name, current_content)
-                
-                # Start new flow block
-                current_block = 'flow'
-                current_name = line[5:].strip(':')
-                current_content = []
-                
-            elif line.startswith('function '):
-                # Save previous block
-                if current_block and current_name:
-                    self._process_block(current_block, current_name, current_content)
-                
-                # Start new function block
-                current_block = 'function'
-                current_name = line[9:].strip(':')
+            
+            block_type = _BLOCK_KEYWORDS.get(keyword)
+            if block_type:
+                # Start new flow or function block
+                current_type = block_type
+                current_name = sys.intern(line[len(keyword):].strip().strip(':'))
                 current_content = []
+                block_indent = indent
+                if current_name:
+                    blocks.append((block_type, current_name, current_content))
                 
-            else:
+            elif current_content is not None:
                 # Add to current block
-                if current_block:
-                    current_content.append(line)
+                current_content.append(line)
         
-        # Process final block
-        if current_block and current_name:
-            self._process_block(current_block, current_name, current_content)
+        # Build the flow and function tables in one pass each
+        self.flows = {name: self._parse_flow_triggers(lines, name)
+                      for block_type, name, lines in blocks if block_type == 'flow'}
+        self.functions = {name: self._parse_function_actions(lines, name)
+                          for block_type, name, lines in blocks if block_type == 'function'}
         
         # Set default variables
         self.variables = {
@@ -143,72 +268,82 @@ class BaikonParser:
             config={}
         )
     
-    def _process_block(self, block_type: str, name: str, content: List[str]):
-        """Process a parsed block"""
-        if block_type == 'flow':
-            self.flows[name] = self._parse_flow_triggers(content, name)
-        elif block_type == 'function':
-            self.functions[name] = self._parse_function_actions(content, name)
-    
     def _parse_flow_triggers(self, content: List[str], flow_name: str) -> Flow:
         """Parse flow trigger rules"""
         triggers = []
         
         for line in content:
-            # Skip middleware lines for now
-            if line.startswith('use '):
+            # Skip middleware and other non-trigger lines for now
+            if not line.startswith('when user says '):
                 continue
                 
             # Match pattern: when user says "text" -> call function_name
-            match = re.match(r'when user says "([^"]+)"\s*->\s*call\s+(\w+)', line)
+            match = _TRIGGER_RE.match(line)
             if match:
-                trigger_text = match.group(1)
-                function_name = match.group(2)
+                trigger_text = sys.intern(self._normalize_pattern(match.group('pattern')))
+                function_name = sys.intern(match.group('function'))
                 triggers.append(FlowTrigger(
                     type=TriggerType.USER_SAYS,
-                    pattern=trigger_text
+                    pattern=trigger_text,
+                    function=function_name
                 ))
                 # Store the function call info
-                if flow_name not in self._trigger_actions:
-                    self._trigger_actions = {}
-                if flow_name not in self._trigger_actions:
-                    self._trigger_actions[flow_name] = {}
-                self._trigger_actions[flow_name][trigger_text] = function_name
+                self._trigger_actions.setdefault(flow_name, {})[trigger_text] = function_name
         
         return Flow(name=flow_name, triggers=triggers, middleware=[])
     
+    @staticmethod
+    def _normalize_pattern(text: str) -> str:
+        """Strip a trigger pattern and lowercase it, leaving /regex/ patterns' case alone"""
+        pattern = text.strip()
+        if is_regex_pattern(pattern):
+            return pattern
+        return pattern.lower()
+    
     def _parse_function_actions(self, content: List[str], func_name: str) -> FlowFunction:
         """Parse function action commands"""
         actions = []
         
         for line in content:
-            # Match pattern: say "text"
-            match = re.match(r'say "([^"]+)"', line)
-            if match:
-                message = match.group(1)
+            # Match pattern: say "text" or set variable = value
+            match = _ACTION_RE.match(line)
+            if match is None:
+                continue
+            
+            if match.lastgroup == 'say':
+                message = match.group('message')
                 actions.append(FlowAction(
                     type=ActionType.SAY,
-                    params={"message": message}
+                    params={"message": message, "_segments": split_template(message)}
                 ))
             
-            # Match pattern: set variable = value
-            match = re.match(r'set (\w+)\s*=\s*(.+)', line)
-            if match:
-                var_name = match.group(1)
-                value = match.group(2).strip().strip('"')
+            elif match.lastgroup == 'set':
+                var_name = sys.intern(match.group('variable'))
+                raw_value = match.group('value').strip()
+                value = raw_value.strip('"')
+                # Quoted values are always text
+                op = (SET_TEXT, value) if raw_value.startswith('"') else compile_set_value(value)
                 actions.append(FlowAction(
                     type=ActionType.SET,
-                    params={"variable": var_name, "value": value}
+                    params={"variable": var_name, "value": value, "_op": op}
                 ))
         
         return FlowFunction(name=func_name, actions=actions)
     
-    # Store trigger->function mapping
-    _trigger_actions = {}
-    
     def get_function_for_trigger(self, flow_name: str, trigger_pattern: str) -> Optional[str]:
         """Get function name for a trigger pattern"""
         return self._trigger_actions.get(flow_name, {}).get(trigger_pattern)
+    
+    def validate_module(self, module: FlowModule) -> List[str]:
+        """List problems in a parsed module, such as triggers calling undefined functions"""
+        # One set lookup per trigger against the module's function table
+        missing = dict.fromkeys(
+            (flow.name, trigger.function)
+            for flow in module.flows.values() for trigger in flow.triggers
+            if trigger.function not in module.functions
+        )
+        return [f"Flow '{flow_name}' calls undefined function '{function_name}'"
+                for flow_name, function_name in missing]
 
 
 def main():